@@ -1,21 +1,74 @@
 from __future__ import annotations
 
+import functools
 import json
 import os.path
 import re
+import stat
 import subprocess
 import tempfile
-import tomllib
 from abc import ABC, abstractmethod
-from collections.abc import Callable, Mapping, Sequence
+from collections import deque
+from collections.abc import Callable, Mapping, Sequence, Set
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, override
+from types import MappingProxyType
+from typing import Any, ClassVar, override
 
 from frozendict import frozendict
 from identify import identify
 from jinja2 import Environment, StrictUndefined
 from jinja2.ext import Extension
 
+_EXACT_VERSION_RE = re.compile(r"[0-9]+\.[0-9]+\.[0-9]+")
+_NODE_VERSION_RE = re.compile(r"v([0-9]+)\.([0-9]+)\.([0-9]+)")
+# A regex with no special characters, other than escaped punctuation, which
+# only matches one string.
+_LITERAL_REGEX_RE = re.compile(r"(?:[^\\.^$*+?{}\[\]|()]|\\[^0-9A-Za-z])*")
+
+
+def _is_number(s: str) -> bool:
+    return s.isascii() and s.isdigit()
+
+
+def _literal_path(regex: str) -> str | None:
+    if _LITERAL_REGEX_RE.fullmatch(regex) is None:
+        return None
+    return re.sub(r"\\(.)", r"\1", regex)
+
+
+def _read_stripped(filename: str) -> str:
+    # Read in binary mode and decode once: these are tiny files, so the text
+    # layer's decoder and buffering cost more than the read itself.
+    try:
+        with open(filename, "rb") as f:
+            return f.read().decode().strip()
+    except OSError:
+        return ""
+
+
+def _invert(mapping: Mapping[str, Set[str]]) -> frozendict[str, frozenset[str]]:
+    out: dict[str, set[str]] = {}
+    for key, values in mapping.items():
+        for value in values:
+            out.setdefault(value, set()).add(key)
+    return frozendict({k: frozenset(v) for k, v in out.items()})
+
+
+def _run_json(args: Sequence[str]) -> Any | None:  # noqa: ANN401
+    # json.loads accepts bytes, so skip decoding the (potentially large) output,
+    # and check for blank output without making a stripped copy of it. Failures
+    # are ignored, so stderr is discarded rather than collected.
+    result = subprocess.run(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=False,
+    )
+    if result.returncode == 0 and result.stdout and not result.stdout.isspace():
+        return json.loads(result.stdout)
+    return None
+
 
 class StrictUndefinedExtension(Extension):  # pragma: no cover
     def __init__(self, environment: Environment) -> None:
@@ -29,16 +82,27 @@ class GitExtension(Extension):
         environment.filters["get_git_user_name"] = GitExtension.get_git_user_name
 
     @staticmethod
-    def get_git_user_name(default: str) -> str:
+    @functools.cache
+    def _git_user_name() -> str | None:
+        # Git itself prefers this over user.name when authoring commits.
+        name = os.getenv("GIT_AUTHOR_NAME", "").strip()
+        if name:
+            return name
+
         result = subprocess.run(
             ["git", "config", "user.name"],
             check=False,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             encoding="utf-8",
         )
         if result.returncode == 0 and result.stdout.strip():
             return result.stdout.strip()
-        return default
+        return None
+
+    @staticmethod
+    def get_git_user_name(default: str) -> str:
+        return GitExtension._git_user_name() or default
 
 
 class PythonExtension(Extension):
@@ -56,10 +120,14 @@ class PythonExtension(Extension):
 
     @staticmethod
     def parse_version(v: str) -> tuple[int, int]:
-        match = re.fullmatch(r"([1-9][0-9]*)\.([0-9]+)(\.[0-9]+)?", v)
-        if match is None:
+        parts = v.split(".")
+        if (
+            len(parts) not in (2, 3)
+            or not all(_is_number(part) for part in parts)
+            or parts[0].startswith("0")
+        ):
             raise ValueError(f"Invalid python version '{v}'")
-        return int(match.group(1)), int(match.group(2))
+        return int(parts[0]), int(parts[1])
 
     @staticmethod
     def parse_versions(vs: Sequence[str]) -> list[tuple[int, int]]:
@@ -93,9 +161,13 @@ class PythonExtension(Extension):
         max_version: str,
     ) -> list[str]:
         highest = PythonExtension.parse_version(max_version)
-        return PythonExtension.join_versions(
-            [v for v in PythonExtension.parse_versions(versions) if v <= highest],
-        )
+        # parse_versions is already sorted and deduplicated, so there's no need
+        # to go through join_versions.
+        return [
+            f"{major}.{minor}"
+            for major, minor in PythonExtension.parse_versions(versions)
+            if (major, minor) <= highest
+        ]
 
     @staticmethod
     def increment_python_version(version: str) -> str:
@@ -104,44 +176,78 @@ class PythonExtension(Extension):
 
 
 class Toml:
+    # The latest parse of each file, along with the file's identity when it was
+    # parsed, so that edits made between renders are picked up and replace the
+    # stale entry.
+    _CACHE: ClassVar[dict[str, tuple[tuple[int, int, int], Mapping[str, Any]]]] = {}
+    # Returned for files that can't be read, rather than a new empty mapping.
+    _EMPTY: ClassVar[Mapping[str, Any]] = MappingProxyType({})
+
     @staticmethod
-    def load(filename: str) -> frozendict[str, Any]:
+    def load(filename: str) -> Mapping[str, Any]:
         try:
-            with open(filename, "rb") as f:
-                return frozendict(tomllib.load(f))
+            st = os.stat(filename)
+            identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+            cached = Toml._CACHE.get(filename)
+            if cached is None or cached[0] != identity:
+                # Deferred: unlike the other stdlib modules used here, tomllib
+                # isn't already loaded by jinja2 or copier, and it's only needed
+                # once a TOML file is actually read.
+                import tomllib  # noqa: PLC0415
+
+                # A read-only view rather than a frozendict, to avoid copying the
+                # parsed document.
+                with open(filename, "rb") as f:
+                    cached = (identity, MappingProxyType(tomllib.load(f)))
+                Toml._CACHE[filename] = cached
+            return cached[1]
         except OSError:
-            return frozendict()
+            return Toml._EMPTY
 
 
 class UV:
     @staticmethod
-    def _uv(
-        args: Sequence[str],
-        *,
-        check: bool = True,
-    ) -> subprocess.CompletedProcess[str]:
+    def _uv_args(args: Sequence[str]) -> list[str]:
         # Make sure we're calling the global uv, in case a dependency installed
         # a different version of uv inside the virtualenv.
         uv = os.getenv("UV", "uv")
+        return [uv, *args]
+
+    @staticmethod
+    def _uv(args: Sequence[str]) -> subprocess.CompletedProcess[str]:
         return subprocess.run(
-            [uv, *args],
+            UV._uv_args(args),
             capture_output=True,
-            check=check,
+            check=True,
             encoding="utf-8",
         )
 
     @staticmethod
+    @functools.cache
     def uv_version() -> str:
         raw = UV._uv(["--version"]).stdout
 
-        match = re.search(r"[0-9]+\.[0-9]+\.[0-9]+", raw)
+        match = _EXACT_VERSION_RE.search(raw)
         if match is None:
             raise ValueError("Can't find uv version")
 
         return match.group(0)
 
     @staticmethod
+    @functools.cache
     def uv_build_spec() -> str:
+        # This is the spec 'uv init' generates, which allows patch upgrades of
+        # the running uv version. Computing it directly avoids running uv init
+        # in a temporary directory.
+        try:
+            version = UV.uv_version()
+        except ValueError:
+            return UV._uv_init_build_spec()
+        major, minor, _ = version.split(".")
+        return f"uv_build>={version},<{major}.{int(minor) + 1}.0"
+
+    @staticmethod
+    def _uv_init_build_spec() -> str:
         with tempfile.TemporaryDirectory() as tmpdir:
             UV._uv(
                 [
@@ -170,6 +276,7 @@ class UV:
         return requires[0]
 
     @staticmethod
+    @functools.cache
     def _default_python_version(version_hint: str) -> str:
         j = json.loads(
             UV._uv(
@@ -177,24 +284,23 @@ class UV:
             ).stdout,
         )
 
-        versions = set()
-        for version in [v["version"] for v in j]:
-            if re.fullmatch(r"[0-9]+\.[0-9]+\.[0-9]+", version) is None:
-                continue
-            versions.add(tuple(int(part) for part in version.split(".")))
+        latest = max(
+            (
+                tuple(int(part) for part in parts)
+                for parts in (v["version"].split(".") for v in j)
+                if len(parts) == 3 and all(_is_number(part) for part in parts)  # noqa: PLR2004
+            ),
+            default=None,
+        )
 
-        if not versions:
+        if latest is None:
             raise ValueError("Can't find a default python version")
 
-        return ".".join(str(v) for v in sorted(versions, reverse=True)[0])
+        return ".".join(str(v) for v in latest)
 
     @staticmethod
     def _existing_python_version() -> str:
-        try:
-            with open(".python-version") as f:
-                return f.read().strip()
-        except OSError:
-            return ""
+        return _read_stripped(".python-version")
 
     @staticmethod
     def python_version(version_hint: str) -> str:
@@ -206,55 +312,90 @@ class UV:
         return UV._default_python_version(version_hint)
 
     @staticmethod
+    @functools.cache
     def installed_python_packages() -> frozenset[str]:
-        result = UV._uv(
-            ["pip", "list", "--format=json"],
-            check=False,
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            return frozenset(p["name"] for p in json.loads(result.stdout))
-        return frozenset()
+        j = _run_json(UV._uv_args(["pip", "list", "--format=json"]))
+        if j is None:
+            return frozenset()
+        return frozenset(p["name"] for p in j)
 
 
 class Nvm:
     @staticmethod
-    def _default_node_version() -> str:
+    def _nvm_args(command: str, *, use: bool = True) -> list[str]:
+        # With use=False, nvm loads without activating the default node version.
+        # Only pass that for commands that don't need a current version: without
+        # an .nvmrc, 'nvm exec' runs in the current version, so it needs one.
+        no_use = "" if use else " --no-use"
+        return ["bash", "-c", f'source "${{NVM_DIR}}/nvm.sh"{no_use} && {command}']
+
+    @staticmethod
+    def _nvm(command: str, *, use: bool = True) -> subprocess.CompletedProcess[str]:
         return subprocess.run(
-            ["bash", "-c", 'source "${NVM_DIR}/nvm.sh" && nvm version stable'],
+            Nvm._nvm_args(command, use=use),
             capture_output=True,
             check=True,
             encoding="utf-8",
-        ).stdout.strip()
+        )
 
     @staticmethod
-    def _existing_node_version() -> str:
+    @functools.cache
+    def _default_node_version() -> str:
+        return (
+            Nvm._installed_node_version()
+            or Nvm._nvm("nvm version stable", use=False).stdout.strip()
+        )
+
+    @staticmethod
+    def _installed_node_version() -> str:
+        # 'nvm version stable' is the newest installed version, unless the
+        # stable or node aliases have been redefined; find that without starting
+        # a shell and loading nvm.
+        nvm_dir = os.getenv("NVM_DIR", "")
+        if not nvm_dir or any(
+            os.path.lexists(os.path.join(nvm_dir, "alias", alias))
+            for alias in ("stable", "node")
+        ):
+            return ""
         try:
-            with open(".nvmrc") as f:
-                return f.read().strip()
+            names = os.listdir(os.path.join(nvm_dir, "versions", "node"))
         except OSError:
             return ""
+        versions = [
+            match
+            for match in map(_NODE_VERSION_RE.fullmatch, names)
+            if match is not None
+        ]
+        if not versions:
+            return ""
+        return max(
+            versions,
+            key=lambda match: tuple(int(part) for part in match.groups()),
+        ).group(0)
+
+    @staticmethod
+    def _existing_node_version() -> str:
+        return _read_stripped(".nvmrc")
 
     @staticmethod
     def node_version() -> str:
         return Nvm._existing_node_version() or Nvm._default_node_version()
 
     @staticmethod
+    def prefetch_node_version(executor: Executor) -> list[Future[str]]:
+        # Starts the nvm subprocess for node_version in the background, if it
+        # will be needed.
+        if Nvm._existing_node_version():
+            return []
+        return [executor.submit(Nvm._default_node_version)]
+
+    @staticmethod
+    @functools.cache
     def installed_node_packages() -> frozenset[str]:
-        result = subprocess.run(
-            [
-                "bash",
-                "-c",
-                'source "${NVM_DIR}/nvm.sh" && nvm exec --silent -- npm list --json',
-            ],
-            capture_output=True,
-            check=False,
-            encoding="utf-8",
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            return frozenset(
-                name for name in json.loads(result.stdout).get("dependencies", {})
-            )
-        return frozenset()
+        j = _run_json(Nvm._nvm_args("nvm exec --silent -- npm list --json"))
+        if j is None:
+            return frozenset()
+        return frozenset(name for name in j.get("dependencies", {}))
 
 
 @dataclass(frozen=True, kw_only=True)
@@ -284,6 +425,23 @@ class Tool:
             },
         )
 
+    def _file_patterns(self) -> frozenset[str]:
+        return frozenset(self.owned_config_files.keys() | self.file_regexes)
+
+    def literal_paths(self) -> frozenset[str]:
+        return frozenset(
+            {
+                path
+                for path in map(_literal_path, self._file_patterns())
+                if path is not None
+            },
+        )
+
+    def path_regexes(self) -> frozenset[str]:
+        return frozenset(
+            {regex for regex in self._file_patterns() if _literal_path(regex) is None},
+        )
+
 
 class Metadata(ABC):
     @abstractmethod
@@ -291,6 +449,61 @@ class Metadata(ABC):
         raise NotImplementedError
 
 
+class TomlDocument:
+    def __init__(self, filename: str) -> None:
+        super().__init__()
+        self._filename = filename
+        self._data = Toml.load(filename)
+
+    def get(
+        self,
+        key: Sequence[str],
+        *,
+        typecheck: Callable[[Any], bool],
+        default: Any | None = None,  # noqa: ANN401
+    ) -> Any | None:  # noqa: ANN401
+        # Keys are almost always 'table.value', so handle that without the
+        # general loop.
+        if len(key) == 2:  # noqa: PLR2004
+            if key[0] not in self._data:
+                return default
+            table = self._table(key, self._data[key[0]])
+            if key[1] not in table:
+                return default
+            return self._value(key, table[key[1]], typecheck)
+
+        data: Mapping[str, Any] = self._data
+        for i, k in enumerate(key):
+            if k not in data:
+                return default
+            v = data[k]
+            if i == len(key) - 1:
+                return self._value(key, v, typecheck)
+            data = self._table(key, v)
+        return None
+
+    def _table(self, key: Sequence[str], v: Any) -> Mapping[str, Any]:  # noqa: ANN401
+        if not isinstance(v, dict):
+            raise TypeError(
+                f"Indexed into {self._filename} value {'.'.join(key)} that "
+                f"isn't a dict (got {type(v)})",
+            )
+        return v
+
+    def _value(
+        self,
+        key: Sequence[str],
+        v: Any,  # noqa: ANN401
+        typecheck: Callable[[Any], bool],
+    ) -> Any:  # noqa: ANN401
+        if not typecheck(v):
+            raise TypeError(
+                f"Value {'.'.join(key)} in {self._filename} has "
+                f"unexpected type {type(v)}",
+            )
+        return v
+
+
 class TomlValue(Metadata):
     def __init__(
         self,
@@ -304,31 +517,24 @@ class TomlValue(Metadata):
         self._key = tuple(part for part in key.split(".") if part)
         self._default = default
 
+    @property
+    def filename(self) -> str:
+        return self._filename
+
     @abstractmethod
     def _typecheck(self, value: Any) -> bool:  # noqa: ANN401  # pragma: no cover
         raise NotImplementedError
 
+    def get_from(self, document: TomlDocument) -> Any | None:  # noqa: ANN401
+        return document.get(
+            self._key,
+            typecheck=self._typecheck,
+            default=self._default,
+        )
+
     @override
     def get(self) -> Any | None:
-        data: Mapping[str, Any] = Toml.load(self._filename)
-        for i, k in enumerate(self._key):
-            if k not in data:
-                return self._default
-            v = data[k]
-            if i == len(self._key) - 1:
-                if not self._typecheck(v):
-                    raise TypeError(
-                        f"Value {'.'.join(self._key)} in {self._filename} has "
-                        f"unexpected type {type(v)}",
-                    )
-                return v
-            if not isinstance(v, dict):
-                raise TypeError(
-                    f"Indexed into {self._filename} value {'.'.join(self._key)} that "
-                    f"isn't a dict (got {type(v)})",
-                )
-            data = v
-        return None
+        return self.get_from(TomlDocument(self._filename))
 
 
 class BoolTomlValue(TomlValue):
@@ -399,6 +605,9 @@ class Config:
 class ConfigExtension(Extension):
     _MIN_PYTHON_VERSION = "3.12"
     _MAX_PYTHON_VERSION = "3.14"
+    _PARALLEL_TAGGING_THRESHOLD = 256
+    # Skipped when listing files outside a git repo.
+    _UNLISTED_DIRS = frozenset({".git", ".venv", "node_modules", "__pycache__"})
 
     _FILE_TYPES: frozendict[str, FileType] = frozendict(
         {
@@ -934,6 +1143,61 @@ class ConfigExtension(Extension):
         },
     )
 
+    # Flattened views of _FILE_TYPES and _TOOLS, used when expanding configs.
+    _FILE_TYPE_TOOLS: frozendict[str, frozenset[str]] = frozendict(
+        {file_type: data.tools for file_type, data in _FILE_TYPES.items()},
+    )
+    _TOOL_DEPENDENCIES: frozendict[str, frozenset[str]] = frozendict(
+        {
+            tool: data.requires
+            | (frozenset({data.installed_by}) if data.installed_by else frozenset())
+            for tool, data in _TOOLS.items()
+        },
+    )
+    _TOOL_FILE_TYPES: frozendict[str, frozenset[str]] = frozendict(
+        {tool: data.all_config_file_types() for tool, data in _TOOLS.items()},
+    )
+
+    # Flattened views of _FILE_TYPES and _TOOLS, used when detecting configs.
+    _TAG_FILE_TYPES: frozendict[str, frozenset[str]] = _invert(
+        {file_type: data.tags for file_type, data in _FILE_TYPES.items()},
+    )
+    _TAG_TOOLS: frozendict[str, frozenset[str]] = _invert(
+        {tool: data.owned_tags for tool, data in _TOOLS.items()},
+    )
+    _RELEVANT_TAGS: frozenset[str] = frozenset(
+        _TAG_FILE_TYPES.keys() | _TAG_TOOLS.keys(),
+    )
+    _TOOL_PYTHON_PACKAGES: frozendict[str, frozenset[str]] = frozendict(
+        {tool: frozenset(data.python_packages) for tool, data in _TOOLS.items()},
+    )
+    _TOOL_NODE_PACKAGES: frozendict[str, frozenset[str]] = frozendict(
+        {tool: frozenset(data.node_packages) for tool, data in _TOOLS.items()},
+    )
+
+    # Paths which some tools' file regexes match literally, mapped to those
+    # tools, so that they can be looked up directly when detecting configs.
+    _PATH_TOOLS: frozendict[str, frozenset[str]] = _invert(
+        {tool: data.literal_paths() for tool, data in _TOOLS.items()},
+    )
+    # Each tool's remaining file regexes, fused into a single pattern, used when
+    # detecting configs. Tools without any such regexes are omitted.
+    _TOOL_REGEXES: frozendict[str, re.Pattern[str]] = frozendict(
+        {
+            tool: re.compile(
+                "|".join(f"(?:{regex})" for regex in sorted(data.path_regexes())),
+            )
+            for tool, data in _TOOLS.items()
+            if data.path_regexes()
+        },
+    )
+    # All of the above in one pattern. Most files don't match any tool, and
+    # this rejects them with a single match; it can't be used on its own to
+    # find which tools match, since several tools can match the same file.
+    _ANY_TOOL_REGEX: re.Pattern[str] = re.compile(
+        "|".join(f"(?:{regex.pattern})" for regex in _TOOL_REGEXES.values()),
+    )
+
     _METADATA = frozendict[str, Metadata](
         {
             "uv_version": Call(UV.uv_version),
@@ -981,38 +1245,81 @@ class ConfigExtension(Extension):
     ) -> RawConfig:
         new = Config.from_yaml(new_raw)
         existing = Config.from_yaml(existing_raw)
-        current_file_types = set(existing.file_types | new.file_types)
-        current_tools = set(existing.tools | new.tools)
-
-        while True:
-            new_file_types = set(current_file_types)
-            new_tools = set(current_tools)
-
-            for file_type in new_file_types:
-                new_tools.update(ConfigExtension._FILE_TYPES[file_type].tools)
-
-            tools_to_add = set()
-            for tool in new_tools:
-                installed_by = ConfigExtension._TOOLS[tool].installed_by
-                if installed_by:
-                    tools_to_add.add(installed_by)
-                tools_to_add.update(ConfigExtension._TOOLS[tool].requires)
-            new_tools.update(tools_to_add)
-
-            for tool in new_tools:
-                new_file_types.update(
-                    ConfigExtension._TOOLS[tool].all_config_file_types(),
-                )
+        file_types, tools = ConfigExtension._expand(
+            existing.file_types | new.file_types,
+            existing.tools | new.tools,
+        )
+        return Config(
+            file_types=file_types,
+            tools=tools,
+            metadata=existing.metadata | new.metadata,
+        ).to_yaml()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _expand(
+        initial_file_types: frozenset[str],
+        initial_tools: frozenset[str],
+    ) -> tuple[frozenset[str], frozenset[str]]:
+        # Everything reachable from a set is everything reachable from each of
+        # its members, so union their (cached) closures rather than walking the
+        # graph again for each new combination.
+        file_types = set(initial_file_types)
+        tools = set(initial_tools)
+        for file_type in initial_file_types:
+            closure_file_types, closure_tools = ConfigExtension._file_type_closure(
+                file_type,
+            )
+            file_types |= closure_file_types
+            tools |= closure_tools
+        for tool in initial_tools:
+            closure_file_types, closure_tools = ConfigExtension._tool_closure(tool)
+            file_types |= closure_file_types
+            tools |= closure_tools
+        return frozenset(file_types), frozenset(tools)
 
-            if new_file_types == current_file_types and new_tools == current_tools:
-                return Config(
-                    file_types=frozenset(new_file_types),
-                    tools=frozenset(new_tools),
-                    metadata=existing.metadata | new.metadata,
-                ).to_yaml()
+    @staticmethod
+    @functools.cache
+    def _file_type_closure(file_type: str) -> tuple[frozenset[str], frozenset[str]]:
+        return ConfigExtension._closure({file_type}, set())
 
-            current_file_types = new_file_types
-            current_tools = new_tools
+    @staticmethod
+    @functools.cache
+    def _tool_closure(tool: str) -> tuple[frozenset[str], frozenset[str]]:
+        return ConfigExtension._closure(set(), {tool})
+
+    @staticmethod
+    def _closure(
+        file_types: set[str],
+        tools: set[str],
+    ) -> tuple[frozenset[str], frozenset[str]]:
+        file_type_tools = ConfigExtension._FILE_TYPE_TOOLS
+        tool_dependencies = ConfigExtension._TOOL_DEPENDENCIES
+        tool_file_types = ConfigExtension._TOOL_FILE_TYPES
+
+        # Worklist closure: each file type and tool is expanded exactly once.
+        file_type_queue = deque(file_types)
+        tool_queue = deque(tools)
+        while file_type_queue or tool_queue:
+            while file_type_queue:
+                file_type = file_type_queue.popleft()
+                for tool in file_type_tools[file_type]:
+                    if tool not in tools:
+                        tools.add(tool)
+                        tool_queue.append(tool)
+
+            while tool_queue:
+                tool = tool_queue.popleft()
+                for dependency in tool_dependencies[tool]:
+                    if dependency not in tools:
+                        tools.add(dependency)
+                        tool_queue.append(dependency)
+                for file_type in tool_file_types[tool]:
+                    if file_type not in file_types:
+                        file_types.add(file_type)
+                        file_type_queue.append(file_type)
+
+        return frozenset(file_types), frozenset(tools)
 
     @staticmethod
     def file_type_tags() -> dict[str, list[str]]:
@@ -1022,59 +1329,182 @@ class ConfigExtension(Extension):
         }
 
     @staticmethod
-    def detect_config(_: str) -> RawConfig:
-        files = sorted(
-            subprocess.run(
-                ["git", "ls-files", "--cached", "--others", "--exclude-standard"],
-                capture_output=True,
-                check=True,
-                encoding="utf-8",
-            )
-            .stdout.strip()
-            .splitlines(),
+    @functools.lru_cache(maxsize=8192)
+    def _filename_tags(filename: str) -> frozenset[str]:
+        return frozenset(identify.tags_from_filename(filename))
+
+    @staticmethod
+    def _tags_from_path(path: str) -> Set[str]:
+        # For regular files whose name identifies their type, this gives the
+        # same type tags as identify.tags_from_path (but not its mode or
+        # encoding tags, which we don't use), without the per-file syscalls,
+        # and shares the lookup between files with the same name.
+        try:
+            mode = os.lstat(path).st_mode
+        except (OSError, ValueError):
+            mode = 0
+        if stat.S_ISREG(mode):
+            tags = ConfigExtension._filename_tags(os.path.basename(path))
+            if tags:
+                return tags
+        return identify.tags_from_path(path)
+
+    @staticmethod
+    def _tags_from_path_or_none(path: str) -> Set[str] | None:
+        try:
+            return ConfigExtension._tags_from_path(path)
+        except ValueError:
+            return None
+
+    @staticmethod
+    @functools.cache
+    def _executor() -> ThreadPoolExecutor:
+        # One pool for the whole run, so that the subprocesses and the file
+        # tagging reuse the same threads rather than each starting their own.
+        return ThreadPoolExecutor()
+
+    @staticmethod
+    def _tags_from_paths(paths: Sequence[str]) -> list[Set[str] | None]:
+        # Tagging may stat and read each file, so overlap the I/O on larger
+        # repos; below the threshold, starting threads costs more than it saves.
+        if len(paths) < ConfigExtension._PARALLEL_TAGGING_THRESHOLD:
+            return [ConfigExtension._tags_from_path_or_none(path) for path in paths]
+        return list(
+            ConfigExtension._executor().map(
+                ConfigExtension._tags_from_path_or_none,
+                paths,
+            ),
+        )
+
+    @staticmethod
+    def _unlisted_dir(root: str, name: str) -> bool:
+        # Tool caches (.pytest_cache, .mypy_cache, ...) and anything marked as a
+        # cache directory would otherwise add spurious file types.
+        return (
+            name in ConfigExtension._UNLISTED_DIRS
+            or (name.startswith(".") and name.endswith("_cache"))
+            or os.path.exists(os.path.join(root, name, "CACHEDIR.TAG"))
+        )
+
+    @staticmethod
+    def _walk_files() -> tuple[str, ...]:
+        files: list[str] = []
+        for root, dirs, filenames in os.walk("."):
+            dirs[:] = [d for d in dirs if not ConfigExtension._unlisted_dir(root, d)]
+            files.extend(os.path.normpath(os.path.join(root, f)) for f in filenames)
+        return tuple(files)
+
+    @staticmethod
+    def _files() -> tuple[str, ...]:
+        # NUL-separated, so that unusual filenames come through unquoted. The
+        # order doesn't matter, so git's own (stable) order is kept rather than
+        # sorting. Messages are untranslated, so that errors can be recognised.
+        result = subprocess.run(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            capture_output=True,
+            check=False,
+            env={**os.environ, "LC_ALL": "C"},
         )
+        # Outside a repo (which may be in a parent directory, so this can't be
+        # checked for up front), list the directory ourselves instead. Any other
+        # failure is a real error.
+        if result.returncode != 0:
+            if b"not a git repository" in result.stderr:
+                return ConfigExtension._walk_files()
+            result.check_returncode()
+        return tuple(os.fsdecode(file) for file in result.stdout.split(b"\0") if file)
 
-        python_packages = UV.installed_python_packages()
-        node_packages = Nvm.installed_node_packages()
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def _detect(
+        files: tuple[str, ...],
+        python_packages: frozenset[str],
+        node_packages: frozenset[str],
+    ) -> tuple[frozenset[str], frozenset[str]]:
+        # Cached on the file list and installed packages, so repeated calls
+        # within one run don't re-tag every file. File contents aren't part of
+        # the key; they aren't expected to change during a run.
+        file_types: set[str] = set()
+        # Installed packages don't depend on the files, so check them once.
+        tool_python_packages = ConfigExtension._TOOL_PYTHON_PACKAGES
+        tool_node_packages = ConfigExtension._TOOL_NODE_PACKAGES
+        tools = {
+            tool
+            for tool in ConfigExtension._TOOLS
+            if not tool_python_packages[tool].isdisjoint(python_packages)
+            or not tool_node_packages[tool].isdisjoint(node_packages)
+        }
 
-        file_types = set()
-        tools = set()
+        tag_file_types = ConfigExtension._TAG_FILE_TYPES
+        tag_tools = ConfigExtension._TAG_TOOLS
+        relevant_tags = ConfigExtension._RELEVANT_TAGS
 
-        for file in files:
-            try:
-                tags = identify.tags_from_path(file)
-            except ValueError:
+        all_tags = ConfigExtension._tags_from_paths(files)
+        for file, tags in zip(files, all_tags, strict=True):
+            if tags is None:
                 continue
 
-            for file_type, file_type_data in ConfigExtension._FILE_TYPES.items():
-                if file_type_data.tags & tags:
-                    file_types.add(file_type)
+            # Most files' tags say nothing about file types or tools, so check
+            # that with one set operation before looking up each tag.
+            if not tags.isdisjoint(relevant_tags):
+                for tag in tags:
+                    file_types.update(tag_file_types.get(tag, ()))
+                    tools.update(tag_tools.get(tag, ()))
+
+            tools.update(ConfigExtension._PATH_TOOLS.get(file, ()))
+
+            if ConfigExtension._ANY_TOOL_REGEX.fullmatch(file) is None:
+                continue
 
-            for tool, tool_data in ConfigExtension._TOOLS.items():
-                if (
-                    tool_data.owned_tags & tags
-                    or tool_data.python_packages.keys() & python_packages
-                    or tool_data.node_packages.keys() & node_packages
-                ):
+            for tool, regex in ConfigExtension._TOOL_REGEXES.items():
+                if tool not in tools and regex.fullmatch(file) is not None:
                     tools.add(tool)
-                    continue
 
-                for regex in (
-                    tool_data.owned_config_files.keys() | tool_data.file_regexes
-                ):
-                    if re.fullmatch(regex, file) is not None:
-                        tools.add(tool)
+        return frozenset(file_types), frozenset(tools)
 
+    @staticmethod
+    def _metadata() -> frozendict[str, Any]:
+        # Values read from the same file share one parsed document.
+        documents: dict[str, TomlDocument] = {}
         metadata = {}
         for m_name, m_data in ConfigExtension._METADATA.items():
-            data = m_data.get()
+            if isinstance(m_data, TomlValue):
+                if m_data.filename not in documents:
+                    documents[m_data.filename] = TomlDocument(m_data.filename)
+                data = m_data.get_from(documents[m_data.filename])
+            else:
+                data = m_data.get()
             if data is not None:
                 metadata[m_name] = data
+        return frozendict(metadata)
+
+    @staticmethod
+    def detect_config(_: str) -> RawConfig:
+        # These are independent subprocesses, so run them at the same time. The
+        # uv build spec and default node version are only needed for the
+        # metadata, but they come from cached subprocess calls, so start those
+        # now too.
+        executor = ConfigExtension._executor()
+        files_future = executor.submit(ConfigExtension._files)
+        python_packages_future = executor.submit(UV.installed_python_packages)
+        node_packages_future = executor.submit(Nvm.installed_node_packages)
+        metadata_futures = [
+            executor.submit(UV.uv_build_spec),
+            *Nvm.prefetch_node_version(executor),
+        ]
+
+        file_types, tools = ConfigExtension._detect(
+            files_future.result(),
+            python_packages_future.result(),
+            node_packages_future.result(),
+        )
 
+        for future in metadata_futures:
+            future.result()
         return Config(
-            file_types=frozenset(file_types),
-            tools=frozenset(tools),
-            metadata=frozendict(metadata),
+            file_types=file_types,
+            tools=tools,
+            metadata=ConfigExtension._metadata(),
         ).to_yaml()
 
     @staticmethod
@@ -1082,21 +1512,39 @@ class ConfigExtension(Extension):
         return UV.python_version(version_hint)
 
     @staticmethod
+    @functools.lru_cache(maxsize=32)
     def _packages(
-        config: RawConfig,
-        selector: Callable[[Tool], frozendict[str, str]],
-    ) -> dict[str, str]:
-        tools = Config.from_yaml(config).tools
-        out: dict[str, str] = {}
-        for tool, data in ConfigExtension._TOOLS.items():
-            if tool in tools:
-                out.update(selector(data))
-        return out
+        tools: frozenset[str],
+    ) -> tuple[frozendict[str, str], frozendict[str, str]]:
+        # Both filters are called with the same config, so work out the python
+        # and node packages together and share the result between them.
+        selected = [
+            data for tool, data in ConfigExtension._TOOLS.items() if tool in tools
+        ]
+        # If tools share a package, the last tool's version wins.
+        return (
+            frozendict(
+                {
+                    package: version
+                    for data in selected
+                    for package, version in data.python_packages.items()
+                },
+            ),
+            frozendict(
+                {
+                    package: version
+                    for data in selected
+                    for package, version in data.node_packages.items()
+                },
+            ),
+        )
 
     @staticmethod
     def python_packages(config: RawConfig) -> dict[str, str]:
-        return ConfigExtension._packages(config, lambda d: d.python_packages)
+        python, _ = ConfigExtension._packages(Config.from_yaml(config).tools)
+        return dict(python)
 
     @staticmethod
     def node_packages(config: RawConfig) -> dict[str, str]:
-        return ConfigExtension._packages(config, lambda d: d.node_packages)
+        _, node = ConfigExtension._packages(Config.from_yaml(config).tools)
+        return dict(node)
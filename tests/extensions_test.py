@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import subprocess
+from concurrent.futures import Executor, Future
 from typing import TYPE_CHECKING
 
 import pytest
@@ -15,10 +17,14 @@ from extensions.extensions import (
     PythonExtension,
     StrTomlValue,
     Toml,
+    TomlDocument,
     Tool,
 )
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
     from pyfakefs.fake_filesystem import FakeFilesystem
     from pytest_mock import MockerFixture
     from pytest_subprocess.fake_process import FakeProcess
@@ -26,17 +32,81 @@ if TYPE_CHECKING:
 # ruff: noqa: S101
 
 
+class InlineExecutor(Executor):
+    # Runs each task as it's submitted. pyfakefs isn't thread-safe, so tests
+    # using fs mustn't run tasks on other threads.
+    def submit[**P, T](
+        self,
+        fn: Callable[P, T],
+        /,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> Future[T]:
+        future: Future[T] = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:  # noqa: BLE001
+            future.set_exception(e)
+        return future
+
+
+def reset_caches() -> None:
+    GitExtension._git_user_name.cache_clear()  # noqa: SLF001
+    UV.uv_version.cache_clear()
+    UV.uv_build_spec.cache_clear()
+    UV._default_python_version.cache_clear()  # noqa: SLF001
+    UV.installed_python_packages.cache_clear()
+    Nvm._default_node_version.cache_clear()  # noqa: SLF001
+    Nvm.installed_node_packages.cache_clear()
+    ConfigExtension._detect.cache_clear()  # noqa: SLF001
+    ConfigExtension._packages.cache_clear()  # noqa: SLF001
+    ConfigExtension._expand.cache_clear()  # noqa: SLF001
+    Toml._CACHE.clear()  # noqa: SLF001
+
+
+@pytest.fixture(autouse=True)
+def clear_caches() -> None:
+    reset_caches()
+
+
 class TestGitExtension:
-    def test_get_git_user_name(self, fp: FakeProcess) -> None:
+    def test_get_git_user_name(
+        self,
+        fp: FakeProcess,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.delenv("GIT_AUTHOR_NAME", raising=False)
+        monkeypatch.delenv("GIT_COMMITTER_NAME", raising=False)
+
         fp.register(["git", "config", "user.name"], stdout=["foo"])
         assert GitExtension.get_git_user_name("bar") == "foo"
+        assert GitExtension.get_git_user_name("baz") == "foo"
+        assert fp.call_count(["git", "config", "user.name"]) == 1
 
+        reset_caches()
         fp.register(["git", "config", "user.name"], stdout=[])
         assert GitExtension.get_git_user_name("bar") == "bar"
 
+        reset_caches()
         fp.register(["git", "config", "user.name"], returncode=1)
         assert GitExtension.get_git_user_name("bar") == "bar"
 
+    def test_get_git_user_name_env(
+        self,
+        fp: FakeProcess,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        monkeypatch.setenv("GIT_AUTHOR_NAME", "foo")
+        monkeypatch.setenv("GIT_COMMITTER_NAME", "bar")
+        assert GitExtension.get_git_user_name("baz") == "foo"
+        assert fp.call_count(["git", "config", "user.name"]) == 0
+
+        # The committer name never becomes the author, so it isn't used.
+        reset_caches()
+        monkeypatch.delenv("GIT_AUTHOR_NAME")
+        fp.register(["git", "config", "user.name"], stdout=["quux"])
+        assert GitExtension.get_git_user_name("baz") == "quux"
+
 
 class TestPythonExtension:
     def test_parse_version(self) -> None:
@@ -46,6 +116,14 @@ class TestPythonExtension:
             PythonExtension.parse_version("3")
         with pytest.raises(ValueError):
             PythonExtension.parse_version("foo")
+        with pytest.raises(ValueError):
+            PythonExtension.parse_version("03.13")
+        with pytest.raises(ValueError):
+            PythonExtension.parse_version("3.13.2.1")
+        with pytest.raises(ValueError):
+            PythonExtension.parse_version("3.13rc1")
+        with pytest.raises(ValueError):
+            PythonExtension.parse_version("3.\u0661")
 
     def test_parse_versions(self) -> None:
         assert PythonExtension.parse_versions([]) == []
@@ -96,6 +174,17 @@ class TestToml:
     ) -> None:
         assert Toml.load("pyproject.toml") == {}
 
+    def test_load_cached(self, fs: FakeFilesystem) -> None:
+        fs.create_file("pyproject.toml", contents='foo = "bar"')
+        data = Toml.load("pyproject.toml")
+        assert Toml.load("pyproject.toml") is data
+
+        fs.remove("pyproject.toml")
+        fs.create_file("pyproject.toml", contents='foo = "baz"')
+        data = Toml.load("pyproject.toml")
+        assert data == {"foo": "baz"}
+        assert Toml.load("pyproject.toml") is data
+
 
 class TestUV:
     def test_uv_version(
@@ -109,6 +198,8 @@ class TestUV:
             stdout="uv 0.9.0",
         )
         assert UV.uv_version() == "0.9.0"
+        assert UV.uv_version() == "0.9.0"
+        assert fp.call_count(["uv", "--version"]) == 1
 
     def test_uv_version_fails(
         self,
@@ -124,12 +215,28 @@ class TestUV:
             UV.uv_version()
 
     def test_uv_build_spec(
+        self,
+        fp: FakeProcess,
+        mocker: MockerFixture,
+    ) -> None:
+        mocker.patch("os.getenv").return_value = "uv"
+        fp.register(
+            ["uv", "--version"],
+            stdout="uv 0.9.18",
+        )
+        assert UV.uv_build_spec() == "uv_build>=0.9.18,<0.10.0"
+
+    def test_uv_build_spec_from_uv_init(
         self,
         fp: FakeProcess,
         fs: FakeFilesystem,
         mocker: MockerFixture,
     ) -> None:
         mocker.patch("os.getenv").return_value = "uv"
+        fp.register(
+            ["uv", "--version"],
+            stdout="uv",
+        )
         mocker.patch(
             "tempfile.TemporaryDirectory",
         ).return_value.__enter__.return_value = "/foo/bar"
@@ -167,6 +274,10 @@ requires = ["foo=bar"]
         mocker: MockerFixture,
     ) -> None:
         mocker.patch("os.getenv").return_value = "uv"
+        fp.register(
+            ["uv", "--version"],
+            stdout="uv",
+        )
         mocker.patch(
             "tempfile.TemporaryDirectory",
         ).return_value.__enter__.return_value = "/foo/bar"
@@ -234,6 +345,13 @@ requires = ["foo=bar"]
 ]""",
         )
         assert UV.python_version("3.12") == "3.12.1"
+        assert UV.python_version("3.12") == "3.12.1"
+        assert (
+            fp.call_count(
+                ["uv", "python", "list", "--output-format=json", "cpython@3.12"],
+            )
+            == 1
+        )
 
     def test_python_version_fails(
         self,
@@ -273,6 +391,14 @@ requires = ["foo=bar"]
         )
         assert UV.installed_python_packages() == frozenset()
 
+        reset_caches()
+        fp.register(
+            ["uv", "pip", "list", "--format=json"],
+            " \n",
+        )
+        assert UV.installed_python_packages() == frozenset()
+
+        reset_caches()
         fp.register(
             ["uv", "pip", "list", "--format=json"],
             returncode=1,
@@ -295,11 +421,69 @@ class TestNvm:
         fs: FakeFilesystem,  # noqa: ARG002
     ) -> None:
         fp.register(
-            ["bash", "-c", 'source "${NVM_DIR}/nvm.sh" && nvm version stable'],
+            ["bash", "-c", 'source "${NVM_DIR}/nvm.sh" --no-use && nvm version stable'],
+            stdout="v24.5.0",
+        )
+        assert Nvm.node_version() == "v24.5.0"
+
+    def test_node_version_installed(
+        self,
+        fp: FakeProcess,
+        fs: FakeFilesystem,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        fp.register(
+            ["bash", "-c", 'source "${NVM_DIR}/nvm.sh" --no-use && nvm version stable'],
             stdout="v24.5.0",
+            occurrences=4,
         )
+        monkeypatch.delenv("NVM_DIR", raising=False)
+        assert Nvm.node_version() == "v24.5.0"
+
+        monkeypatch.setenv("NVM_DIR", "/nvm")
+        reset_caches()
         assert Nvm.node_version() == "v24.5.0"
 
+        fs.create_dir("/nvm/versions/node/foo")
+        reset_caches()
+        assert Nvm.node_version() == "v24.5.0"
+
+        fs.create_dir("/nvm/versions/node/v9.11.2")
+        fs.create_dir("/nvm/versions/node/v24.10.0")
+        fs.create_dir("/nvm/versions/node/v24.9.1")
+        reset_caches()
+        assert Nvm.node_version() == "v24.10.0"
+
+        fs.create_file("/nvm/alias/stable", contents="v9.11.2")
+        reset_caches()
+        assert Nvm.node_version() == "v24.5.0"
+
+    def test_prefetch_node_version(
+        self,
+        fp: FakeProcess,
+        fs: FakeFilesystem,
+    ) -> None:
+        fp.register(
+            ["bash", "-c", 'source "${NVM_DIR}/nvm.sh" --no-use && nvm version stable'],
+            stdout="v24.5.0",
+        )
+        futures = Nvm.prefetch_node_version(InlineExecutor())
+        assert [f.result() for f in futures] == ["v24.5.0"]
+        assert Nvm.node_version() == "v24.5.0"
+        assert (
+            fp.call_count(
+                [
+                    "bash",
+                    "-c",
+                    'source "${NVM_DIR}/nvm.sh" --no-use && nvm version stable',
+                ],
+            )
+            == 1
+        )
+
+        fs.create_file(".nvmrc", contents="v24.6.0")
+        assert Nvm.prefetch_node_version(InlineExecutor()) == []
+
     def test_installed_node_packages(self, fp: FakeProcess) -> None:
         fp.register(
             [
@@ -311,6 +495,7 @@ class TestNvm:
         )
         assert Nvm.installed_node_packages() == frozenset()
 
+        reset_caches()
         fp.register(
             [
                 "bash",
@@ -321,6 +506,24 @@ class TestNvm:
         )
         assert Nvm.installed_node_packages() == frozenset({"foo", "bar"})
 
+    def test_installed_node_packages_without_nvmrc(
+        self,
+        fp: FakeProcess,
+        fs: FakeFilesystem,
+    ) -> None:
+        # Without an .nvmrc, nvm exec uses the current version, so nvm must load
+        # the default one (i.e. no --no-use).
+        fs.create_file("package.json", contents="{}")
+        fp.register(
+            [
+                "bash",
+                "-c",
+                'source "${NVM_DIR}/nvm.sh" && nvm exec --silent -- npm list --json',
+            ],
+            '{"dependencies": {"foo": {}}}',
+        )
+        assert Nvm.installed_node_packages() == frozenset({"foo"})
+
     def test_installed_node_packages_fails(self, fp: FakeProcess) -> None:
         fp.register(
             [
@@ -332,6 +535,7 @@ class TestNvm:
         )
         assert Nvm.installed_node_packages() == frozenset()
 
+        reset_caches()
         fp.register(
             [
                 "bash",
@@ -361,6 +565,44 @@ class TestTool:
             installed_by=None,
         ).all_config_file_types() == frozenset({"a", "b"})
 
+    def test_file_patterns(self) -> None:
+        t = Tool(
+            owned_config_files=frozendict({r"foo\.json": None, r"\.bar/.*": None}),
+            shared_config_files=frozendict(),
+            installed_by=None,
+            file_regexes=frozenset({r"(.*/)?baz\.py", r"a\+b", r"\d"}),
+        )
+        assert t.literal_paths() == frozenset({"foo.json", "a+b"})
+        assert t.path_regexes() == frozenset({r"\.bar/.*", r"(.*/)?baz\.py", r"\d"})
+
+
+class TestTomlDocument:
+    def test_get(self, fs: FakeFilesystem) -> None:
+        fs.create_file("pyproject.toml", contents="[foo]\nbar = 'baz'\nquux = true")
+        d = TomlDocument("pyproject.toml")
+        fs.remove("pyproject.toml")
+        assert d.get(("foo", "bar"), typecheck=lambda v: isinstance(v, str)) == "baz"
+        assert d.get(("foo", "quux"), typecheck=lambda v: isinstance(v, bool))
+        assert d.get(("foo", "a"), typecheck=lambda _: True, default=1) == 1
+        with pytest.raises(TypeError):
+            d.get(("foo", "bar"), typecheck=lambda v: isinstance(v, int))
+        with pytest.raises(TypeError):
+            d.get(("foo", "bar", "baz"), typecheck=lambda _: True)
+
+    def test_get_other_lengths(self, fs: FakeFilesystem) -> None:
+        fs.create_file("pyproject.toml", contents="a = 'b'\n[foo.bar]\nbaz = 'quux'")
+        d = TomlDocument("pyproject.toml")
+        assert d.get((), typecheck=lambda _: True) is None
+        assert d.get(("a",), typecheck=lambda v: isinstance(v, str)) == "b"
+        assert d.get(("b",), typecheck=lambda _: True, default="c") == "c"
+        assert (
+            d.get(("foo", "bar", "baz"), typecheck=lambda v: isinstance(v, str))
+            == "quux"
+        )
+        assert d.get(("foo", "bar", "a"), typecheck=lambda _: True) is None
+        with pytest.raises(TypeError):
+            d.get(("a",), typecheck=lambda v: isinstance(v, bool))
+
 
 class TestTomlValue:
     def test_bool_toml_value(self, fs: FakeFilesystem) -> None:
@@ -617,6 +859,35 @@ class TestConfigExtension:
             },
         }
 
+    def test_expand_config_cached(self) -> None:
+        expected = ConfigExtension.expand_config(
+            {"tools": ["pytest"], "metadata": {"a": 1}},
+            {"file_types": ["shell"]},
+        )
+        assert (
+            ConfigExtension.expand_config(
+                {"file_types": ["shell"], "tools": ["pytest"]},
+                {"metadata": {"a": 1}},
+            )
+            == expected
+        )
+
+        # Callers can't change the results of later calls.
+        expected["tools"].append("foo")  # type: ignore[union-attr]
+        reset_caches()
+        result = ConfigExtension.expand_config(
+            {"tools": ["pytest"], "metadata": {"a": 1}},
+            {"file_types": ["shell"]},
+        )
+        assert "foo" not in result["tools"]  # type: ignore[operator]
+        assert (
+            ConfigExtension.expand_config(
+                {"tools": ["pytest"], "metadata": {"a": 1}},
+                {"file_types": ["shell"]},
+            )
+            == result
+        )
+
     def test_file_type_tags(self) -> None:
         assert ConfigExtension.file_type_tags() == {
             "shell": ["shell"],
@@ -630,6 +901,45 @@ class TestConfigExtension:
             "toml": ["toml"],
         }
 
+    def test_tags_from_path(self, fs: FakeFilesystem) -> None:
+        fs.create_file("foo.py", contents="")
+        fs.create_file("bar/bar", contents="#!/bin/bash")
+        fs.chmod("bar/bar", 0o700)
+        fs.create_symlink("baz.py", "foo.py")
+
+        assert "python" in ConfigExtension._tags_from_path("foo.py")  # noqa: SLF001
+        assert "shell" in ConfigExtension._tags_from_path("bar/bar")  # noqa: SLF001
+        assert ConfigExtension._tags_from_path("baz.py") == {"symlink"}  # noqa: SLF001
+        assert ConfigExtension._tags_from_path("bar") == {"directory"}  # noqa: SLF001
+        with pytest.raises(ValueError):
+            ConfigExtension._tags_from_path("quux")  # noqa: SLF001
+
+    def test_tags_from_paths(
+        self,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        # Uses the real filesystem, since pyfakefs isn't thread-safe.
+        monkeypatch.chdir(tmp_path)
+        paths = []
+        for i in range(300):
+            path = f"{i}.py" if i % 2 else f"{i}.sh"
+            with open(path, "w", encoding="utf-8"):
+                pass
+            paths.append(path)
+        paths.append("missing")
+
+        tags = ConfigExtension._tags_from_paths(paths)  # noqa: SLF001
+        assert tags == [
+            ConfigExtension._tags_from_path_or_none(path)  # noqa: SLF001
+            for path in paths
+        ]
+        assert tags[0] is not None
+        assert "shell" in tags[0]
+        assert tags[1] is not None
+        assert "python" in tags[1]
+        assert tags[-1] is None
+
     def test_detect_config(
         self,
         fp: FakeProcess,
@@ -637,9 +947,10 @@ class TestConfigExtension:
         mocker: MockerFixture,
     ) -> None:
         mocker.patch("os.getenv").return_value = "uv"
-        mocker.patch(
-            "tempfile.TemporaryDirectory",
-        ).return_value.__enter__.return_value = "/foo/bar"
+        mocker.patch.object(
+            ConfigExtension,
+            "_executor",
+        ).return_value = InlineExecutor()
 
         fs.create_file("foo.py", contents="")
         fs.create_file("bar/bar", contents="#!/bin/bash")
@@ -657,49 +968,23 @@ package = false
 """,
         )
         fs.create_file(".nvmrc", contents="v24.6.0")
-        fs.create_file(
-            "/foo/bar/pyproject.toml",
-            contents="""
-[build-system]
-requires = ["foo=bar"]
-""",
-        )
 
         fp.register(
-            ["git", "ls-files", "--cached", "--others", "--exclude-standard"],
-            stdout=[
-                "foo.py",
-                "bar/bar",
-                "baz.bats",
-                "quux",
-                "conftest.py",
-                "pyproject.toml",
-                ".nvmrc",
-                "/foo/bar/pyproject.toml",
-            ],
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            stdout=(
+                b"foo.py\0"
+                b"bar/bar\0"
+                b"baz.bats\0"
+                b"quux\0"
+                b"conftest.py\0"
+                b"pyproject.toml\0"
+                b".nvmrc\0"
+            ),
         )
         fp.register(
             ["uv", "--version"],
             stdout="uv 0.9.0",
         )
-        fp.register(
-            [
-                "uv",
-                "init",
-                "--name",
-                "temp",
-                "--bare",
-                "--package",
-                "--build-backend",
-                "uv",
-                "--vcs",
-                "none",
-                "--author-from",
-                "none",
-                "--no-workspace",
-                "/foo/bar",
-            ],
-        )
         fp.register(
             ["uv", "pip", "list", "--format=json"],
             '[{"name": "mypy"}]',
@@ -713,7 +998,8 @@ requires = ["foo=bar"]
             '{"dependencies": {"prettier": {}}}',
         )
 
-        assert ConfigExtension.detect_config("") == {
+        config = ConfigExtension.detect_config("")
+        assert config == {
             "file_types": [
                 "python",
                 "shell",
@@ -729,7 +1015,7 @@ requires = ["foo=bar"]
             ],
             "metadata": {
                 "uv_version": "0.9.0",
-                "uv_build_spec": "foo=bar",
+                "uv_build_spec": "uv_build>=0.9.0,<0.10.0",
                 "template_min_allowed_python_version": "3.12",
                 "template_max_allowed_python_version": "3.14",
                 "template_allowed_python_versions": [
@@ -754,6 +1040,76 @@ requires = ["foo=bar"]
             },
         }
 
+        fp.register(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            stdout=(
+                b"foo.py\0"
+                b"bar/bar\0"
+                b"baz.bats\0"
+                b"quux\0"
+                b"conftest.py\0"
+                b"pyproject.toml\0"
+                b".nvmrc\0"
+            ),
+        )
+        assert ConfigExtension.detect_config("") == config
+        # The file list is fetched again, but installed packages aren't.
+        assert fp.call_count(["uv", "pip", "list", "--format=json"]) == 1
+
+    def test_files_in_git_subdirectory(
+        self,
+        fp: FakeProcess,
+        fs: FakeFilesystem,
+    ) -> None:
+        # The repo root, and its .git, is a parent of the current directory.
+        fs.create_file("foo.py")
+        fs.create_file("build/gen.sh")
+        fp.register(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            stdout=b"foo.py\0",
+        )
+        assert ConfigExtension._files() == ("foo.py",)  # noqa: SLF001
+
+    def test_files_outside_git_repo(
+        self,
+        fp: FakeProcess,
+        fs: FakeFilesystem,
+    ) -> None:
+        fp.register(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            returncode=128,
+            stderr=(
+                "fatal: not a git repository (or any of the parent directories): .git"
+            ),
+        )
+        fs.create_file("foo.py")
+        fs.create_file("bar/baz.sh")
+        fs.create_file(".venv/bin/python")
+        fs.create_file("node_modules/quux/index.js")
+        fs.create_file("bar/__pycache__/baz.pyc")
+        fs.create_file(".pytest_cache/README.md")
+        fs.create_file(".mypy_cache/3.13/foo.data.json")
+        fs.create_file("build/CACHEDIR.TAG")
+        fs.create_file("build/out.json")
+        assert sorted(ConfigExtension._files()) == [  # noqa: SLF001
+            "bar/baz.sh",
+            "foo.py",
+        ]
+
+    def test_files_git_error(
+        self,
+        fp: FakeProcess,
+        fs: FakeFilesystem,
+    ) -> None:
+        fs.create_file("foo.py")
+        fp.register(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            returncode=128,
+            stderr="fatal: detected dubious ownership in repository at '/foo'",
+        )
+        with pytest.raises(subprocess.CalledProcessError):
+            ConfigExtension._files()  # noqa: SLF001
+
     def test_python_version_exact(
         self,
         fp: FakeProcess,  # noqa: ARG002
@@ -780,3 +1136,16 @@ requires = ["foo=bar"]
             "stylelint",
             "stylelint-config-standard",
         }
+
+    def test_packages_cached(self) -> None:
+        config = {"tools": ["pytest", "prettier"]}
+        python_packages = ConfigExtension.python_packages(config)
+        node_packages = ConfigExtension.node_packages(config)
+        assert "pytest" in python_packages
+        assert "prettier" in node_packages
+
+        # Callers can't change the results of later calls.
+        python_packages.clear()
+        node_packages.clear()
+        assert "pytest" in ConfigExtension.python_packages(config)
+        assert "prettier" in ConfigExtension.node_packages(config)